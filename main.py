@@ -1,4 +1,5 @@
 # Standard library
+import argparse
 import time
 import os
 
@@ -24,93 +25,191 @@ from src.process_files import (
     create_log_dataframe,
     update_optimization_json,
 )
-from src.web_scrape import multiprocess_downloads, get_hotels_for_query
+from src.web_scrape import (
+    multiprocess_downloads,
+    multiprocess_queue_downloads,
+    get_hotels_for_query,
+)
+from src.log_setup import start_logging, stop_logging, get_log_queue
+from src.work_queue import get_work_queue, wait_for_queue, DONE
 
 
-def main():
-    """
-    Application flow:
-    1. Scrapes available hotel list from the vendor website, this is used to query the GCP database to get optimization details. We do it this way because there are 'Enabled' hotels on the vendor site that are not known in the database, so to avoid checking against 2600 hotels to see if they're enabled we are grabbing the list directly from the source.
-    2. Query the database for optimization details then use this same hotel list to log into and download files from the vendor site, using up to 3 multiprocesses workers for performance. We validate that downloads were successful, if not it will retry twice. Files that are validated are moved from ./data/downloads to ./data/raw for additional processing.
-    3. Files modified with additional data points and saved as csv files to ./data/processed
-    4. Database query runs to turn all transactions with current_ind = 'Y' to null
-    5. Files are then read into Pandas to be converted to a DataFrame and then uploaded to GCP.
-    6. A log DataFrame is created from the files in ./data/raw and uploaded to the appropriate target table.
-    7. Copy process kicks off which copies both ./data/raw and ./data/processed files to GCS Storage for later reference.
-    8. Clean up process deletes files from ./data/downloads ./data/raw and ./data/processed
-    """
-    raw_directory = "./data/raw"
-    processed_directory = "./data/processed"
-    raw_gcs_path = "gs://storage/path"
-    modified_gcs_path = "gs://storage/path"
+def process_downloaded_files(
+    raw_directory: str,
+    processed_directory: str,
+    raw_gcs_path: str,
+    modified_gcs_path: str,
+) -> bool:
+    """Modify the downloaded files, load them to GCP, back them up to GCS and clean up. Shared by the single host
+    flow and the worker hosts in distributed mode. Returns False when there was nothing to process."""
 
-    start_timer = time.perf_counter()
-    logger.info("++++++ Beginning Process ++++++")
+    # Sanity check to make sure there are downloaded files
+    contents = os.listdir(raw_directory)
 
-    # Scrape website for hotel list
-    available_hotels = get_hotels_for_query()
+    if not contents:
+        logger.warning("No files were found for upload.", extra={"stage": "process"})
+        return False
 
-    # Use that scraped list to query the database
-    queried_hotel_list = get_hotel_list(available_hotels=available_hotels)
-    hotels_to_download = validate_lst_optimizations(queried_hotel_list)
+    logger.debug(f"File Contents: {contents}", extra={"stage": "process"})
 
-    # Only hotels where their optimization in the DB doesn't match the json require additional action
-    if hotels_to_download is None:
-        logger.info("No hotels to update at this time.")
-    else:
-        multiprocess_downloads(hotels_to_download["hotel_cd"])
+    # Multiprocess modifying and saving new files
+    raw_hotel_files = find_files(raw_directory)
+    hotels = initiate_multiprocess(func=create_modified_files, iterable=raw_hotel_files)
 
-        # Sanity check to make sure there are downloaded files
-        contents = os.listdir(raw_directory)
+    # Create dataframe for rate rule table
+    modified_hotel_files = find_files(processed_directory)
+    rate_rule_df = create_rate_rule_dataframe(modified_hotel_files)
 
-        if contents:
-            logger.debug(f"File Contents: {contents}")
+    # Create dataframe for log table
+    log_df = create_log_dataframe(hotels, processed_directory)
 
-            # Multiprocess modifying and saving new files
-            raw_hotel_files = find_files(raw_directory)
-            hotels = initiate_multiprocess(
-                func=create_modified_files, iterable=raw_hotel_files
-            )
+    # Clear indicators in table for existing records
+    remove_current_ind(hotels)
 
-            # Create dataframe for rate rule table
-            modified_hotel_files = find_files(processed_directory)
-            rate_rule_df = create_rate_rule_dataframe(modified_hotel_files)
+    # Load rate rules data to GCP
+    load_dataframe_to_gcp(rate_rule_df, destination=rate_rules_table)
+    # Load log data to GCP
+    load_dataframe_to_gcp(log_df, destination=log_table)
 
-            # Create dataframe for log table
-            log_df = create_log_dataframe(hotels, processed_directory)
+    # Copy Files to Google Cloud Storage
+    initiate_multiprocess(
+        func=copy_files_to_gcs,
+        iterable=raw_hotel_files,
+        extra_param=raw_gcs_path,
+    )
+    initiate_multiprocess(
+        func=copy_files_to_gcs,
+        iterable=modified_hotel_files,
+        extra_param=modified_gcs_path,
+    )
 
-            # Clear indicators in table for existing records
-            remove_current_ind(hotels)
+    # Remove downloaded, processed, and raw files
+    clean_up_downloads()
 
-            # Load rate rules data to GCP
-            load_dataframe_to_gcp(rate_rule_df, destination=rate_rules_table)
-            # Load log data to GCP
-            load_dataframe_to_gcp(log_df, destination=log_table)
+    return True
 
-            # Update the optimization json with the information from the database
-            update_optimization_json(queried_hotel_list)
 
-            # Copy Files to Google Cloud Storage
-            initiate_multiprocess(
-                func=copy_files_to_gcs,
-                iterable=raw_hotel_files,
-                extra_param=raw_gcs_path,
-            )
-            initiate_multiprocess(
-                func=copy_files_to_gcs,
-                iterable=modified_hotel_files,
-                extra_param=modified_gcs_path,
-            )
+def main(mode: str = "local", queue_url: str = None):
+    """
+    Application flow:
+    1. Scrapes available hotel list from the vendor website, this is used to query the GCP database to get optimization details. We do it this way because there are 'Enabled' hotels on the vendor site that are not known in the database, so to avoid checking against 2600 hotels to see if they're enabled we are grabbing the list directly from the source.
+    2. Query the database for optimization details then use this same hotel list to log into and download files from the vendor site, using up to 3 multiprocesses workers for performance. We validate that downloads were successful, if not it will retry twice. Files that are validated are moved from ./data/downloads to ./data/raw for additional processing.
+    3. Files modified with additional data points and saved as csv files to ./data/processed
+    4. Database query runs to turn all transactions with current_ind = 'Y' to null
+    5. Files are then read into Pandas to be converted to a DataFrame and then uploaded to GCP.
+    6. A log DataFrame is created from the files in ./data/raw and uploaded to the appropriate target table.
+    7. Copy process kicks off which copies both ./data/raw and ./data/processed files to GCS Storage for later reference.
+    8. Clean up process deletes files from ./data/downloads ./data/raw and ./data/processed
 
-            # Remove downloaded, processed, and raw files
-            clean_up_downloads()
+    Distributed mode splits this across hosts sharing a work queue (queue_url):
+    - 'coordinator' runs step 1, publishes the hotels needing downloads to the queue, waits for the workers to report
+      back and then updates the optimization json for the hotels that succeeded.
+    - 'worker' leases hotels from the queue with its own vendor credentials and runs steps 2-8 for the hotels it
+      downloaded, reporting them as done only once their files are loaded. Workers stop as soon as they find the queue
+      empty, so start them after the coordinator has published.
+    """
+    if mode != "local" and not queue_url:
+        raise ValueError(f"A work queue url is required in {mode} mode")
+
+    # Started here as well so calling main() directly, e.g. from the notebook, still writes the log file
+    started_logging = get_log_queue() is None
+    if started_logging:
+        start_logging()
+
+    try:
+        raw_directory = "./data/raw"
+        processed_directory = "./data/processed"
+        raw_gcs_path = "gs://storage/path"
+        modified_gcs_path = "gs://storage/path"
+
+        start_timer = time.perf_counter()
+        logger.info("++++++ Beginning Process ++++++")
+
+        if mode == "worker":
+            downloaded_hotels = multiprocess_queue_downloads(queue_url)
+            logger.info(
+                f"Downloaded {len(downloaded_hotels)} hotel(s) from the work queue",
+                extra={"stage": "download"},
+            )
+            if not downloaded_hotels:
+                logger.warning(
+                    "No hotels were leased, check the queue url and that the coordinator has published",
+                    extra={"stage": "download"},
+                )
+
+            # Hotels are only reported once their data is loaded, so a failed load leaves them to be downloaded again
+            queue = get_work_queue(queue_url)
+            try:
+                if downloaded_hotels:
+                    process_downloaded_files(
+                        raw_directory, processed_directory, raw_gcs_path, modified_gcs_path
+                    )
+            except Exception as e:
+                for hotel, worker_id in downloaded_hotels:
+                    queue.report(hotel, worker_id, success=False, error=repr(e))
+                raise
+            else:
+                for hotel, worker_id in downloaded_hotels:
+                    queue.report(hotel, worker_id, success=True)
         else:
-            logger.warning("No files were found for upload.")
-
-    end_time = time.perf_counter()
-    logger.info(f"Finished in: {round(end_time-start_timer, 2)} second(s)")
-    logger.info("------ Complete ------")
+            # Scrape website for hotel list
+            available_hotels = get_hotels_for_query()
+
+            # Use that scraped list to query the database
+            queried_hotel_list = get_hotel_list(available_hotels=available_hotels)
+            hotels_to_download = validate_lst_optimizations(queried_hotel_list)
+
+            # Only hotels where their optimization in the DB doesn't match the json require additional action
+            if hotels_to_download is None:
+                logger.info("No hotels to update at this time.")
+            elif mode == "coordinator":
+                queue = get_work_queue(queue_url)
+                queue.publish(hotels_to_download["hotel_cd"].tolist())
+                results = wait_for_queue(queue)
+
+                # Only hotels the workers reported as loaded get the new timestamp, anything else (including hotels
+                # missing from the results) keeps the old one so the next run picks it up again
+                done = [hotel for hotel, status in results.items() if status == DONE]
+                unfinished = sorted(set(hotels_to_download["hotel_cd"]) - set(done))
+                if unfinished:
+                    logger.warning(
+                        f"Hotels not downloaded by any worker: {unfinished}",
+                        extra={"stage": "coordinate"},
+                    )
+
+                update_optimization_json(
+                    queried_hotel_list[queried_hotel_list["hotel_cd"].isin(done)]
+                )
+            else:
+                multiprocess_downloads(hotels_to_download["hotel_cd"])
+
+                if process_downloaded_files(
+                    raw_directory, processed_directory, raw_gcs_path, modified_gcs_path
+                ):
+                    # Update the optimization json with the information from the database
+                    update_optimization_json(queried_hotel_list)
+
+        end_time = time.perf_counter()
+        logger.info(f"Finished in: {round(end_time-start_timer, 2)} second(s)")
+        logger.info("------ Complete ------")
+    finally:
+        if started_logging:
+            stop_logging()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--mode", choices=["local", "coordinator", "worker"], default="local"
+    )
+    parser.add_argument(
+        "--queue-url",
+        default=os.getenv("WORK_QUEUE_URL"),
+        help="Required for coordinator and worker modes: redis://host:port/db, or sqlite:///path/to/queue.db when every worker is on the same host",
+    )
+    args = parser.parse_args()
+
+    if args.mode != "local" and not args.queue_url:
+        parser.error(f"--queue-url or WORK_QUEUE_URL is required in {args.mode} mode")
+
+    main(mode=args.mode, queue_url=args.queue_url)
@@ -0,0 +1,152 @@
+# Third Party
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
+
+# Standard library
+import time
+
+# Internal
+from .utils import (
+    logger,
+)
+
+# Scripts run inside the browser so a whole list comes back in one WebDriver round trip
+COUNT_SCRIPT = """
+const root = arguments[1] ? document.querySelector(arguments[1]) : document;
+return root ? root.querySelectorAll(arguments[0]).length : 0;
+"""
+
+# Items are looked up inside the container only, so other lists on the page aren't mixed in. Virtualized lists only
+# render the rows in view, so the container is scrolled back to the top and then down a page at a time, waiting for
+# the rendered rows to change before collecting them. Items are keyed by their list position (data-offset-index or
+# aria-posinset) so identical entries aren't merged.
+LIST_SCRIPT = """
+const [containerSelector, itemSelector, maxWaitMs, done] = arguments;
+const container = document.querySelector(containerSelector);
+const items = new Map();
+const keyOf = (el) => {
+    const row = el.closest('[data-offset-index], [aria-posinset]');
+    if (!row) { return null; }
+    return Number(row.getAttribute('data-offset-index') ?? row.getAttribute('aria-posinset'));
+};
+const root = container ?? document;
+const rendered = () => Array.from(root.querySelectorAll(itemSelector));
+let virtualized = false;
+const collect = () => {
+    rendered().forEach((el, i) => {
+        const text = el.textContent.trim();
+        // Without a position attribute fall back to DOM order, or to the text itself once rows are being recycled
+        const key = keyOf(el) ?? (virtualized ? `text-${text}` : `dom-${i}`);
+        items.set(key, text);
+    });
+};
+const result = () => Array.from(items.entries())
+    .sort(([a], [b]) => (typeof a === 'number' && typeof b === 'number' ? a - b : 0))
+    .map(([, text]) => text);
+
+const first = rendered()[0];
+const setSize = first && first.closest('[aria-setsize]') ? Number(first.closest('[aria-setsize]').getAttribute('aria-setsize')) : null;
+virtualized = container !== null && (
+    container.querySelector('.k-height-container, .k-virtual-content') !== null
+    || (setSize !== null && rendered().length < setSize)
+);
+
+collect();
+if (!virtualized) { done(result()); return; }
+
+const signature = () => rendered().map(el => keyOf(el) ?? el.textContent.trim()).join(',');
+const finish = () => {
+    container.scrollTop = 0;
+    done(result());
+};
+// Scroll, wait for the rendered rows to change (or give up after maxWaitMs), collect, then continue. The callback is
+// told whether the container actually moved so a list that can't scroll any further can't loop forever.
+const scrollTo = (top, then) => {
+    const before = signature();
+    const previousTop = container.scrollTop;
+    container.scrollTop = top;
+    if (container.scrollTop === previousTop) {
+        collect();
+        then(false);
+        return;
+    }
+    const started = performance.now();
+    const waitForRows = () => {
+        if (signature() !== before || performance.now() - started > maxWaitMs) {
+            collect();
+            then(true);
+        } else {
+            requestAnimationFrame(waitForRows);
+        }
+    };
+    requestAnimationFrame(waitForRows);
+};
+const step = () => {
+    if (container.scrollTop + container.clientHeight >= container.scrollHeight - 1) {
+        finish();
+        return;
+    }
+    scrollTo(container.scrollTop + container.clientHeight, moved => (moved ? step() : finish()));
+};
+// The popup may open scrolled to the selected item, so start from the top before stepping down
+scrollTo(0, step);
+"""
+
+
+def wait_for_stable_count(
+    driver: webdriver,
+    css_selector: str,
+    container_selector: str = None,
+    timeout: int = 15,
+    poll_interval: float = 0.25,
+    stable_polls: int = 3,
+) -> int:
+    """Wait for the number of elements matching the selector to stop changing, instead of sleeping for a fixed
+    amount of time while a list loads. Only elements inside the container are counted when one is given. Returns the
+    final count."""
+
+    deadline = time.monotonic() + timeout
+    last_count = -1
+    unchanged = 0
+
+    while time.monotonic() < deadline:
+        count = driver.execute_script(COUNT_SCRIPT, css_selector, container_selector)
+        if count and count == last_count:
+            unchanged += 1
+            if unchanged >= stable_polls:
+                return count
+        else:
+            unchanged = 0
+        last_count = count
+        time.sleep(poll_interval)
+
+    raise TimeoutException(f"Element count for {css_selector} did not settle")
+
+
+def extract_list(
+    driver: webdriver,
+    container_selector: str,
+    item_selector: str,
+    max_wait_ms: int = 1000,
+    timeout: int = 120,
+) -> list:
+    """Return the text of every item inside the container, such as a kendo dropdown, in one scripted call. Plain lists
+    are read as rendered; virtualized lists are scrolled through inside the browser so items outside the view aren't
+    missed."""
+
+    previous_timeout = driver.timeouts.script
+    driver.set_script_timeout(timeout)
+    try:
+        items = driver.execute_async_script(
+            LIST_SCRIPT, container_selector, item_selector, max_wait_ms
+        )
+    finally:
+        driver.set_script_timeout(previous_timeout)
+
+    logger.debug(f"Extracted {len(items)} item(s) from {container_selector}")
+
+    return items
+
+
+if __name__ == "__main__":
+    pass
@@ -2,6 +2,10 @@ from google.cloud import bigquery
 import pandas as pd
 
 import subprocess
+import hashlib
+import json
+import time
+import os
 from src.utils import (
     logger,
 )
@@ -34,7 +38,8 @@ def remove_current_ind(hotel_list: str):
 
     formatted_hotel_list = ", ".join(['"' + hotel + '"' for hotel in hotel_list])
     logger.info(
-        f"Removing current_ind for the following hotels: {formatted_hotel_list}"
+        f"Removing current_ind for the following hotels: {formatted_hotel_list}",
+        extra={"stage": "load"},
     )
     update_query = f"UPDATE `{target_table}` SET CURRENT_IND = NULL WHERE CURRENT_IND = 'Y' AND LOC_ID in ({formatted_hotel_list})"
     cmd = [
@@ -47,15 +52,64 @@ def remove_current_ind(hotel_list: str):
     subprocess.run(cmd)
 
 
-def get_hotel_list(available_hotels) -> pd.DataFrame:
-    """Use the scraped list from the vendor website to query the table for Optimization details on the provided hotels."""
-
-    stmt = f"""SELECT QUERY with {available_hotels}"""
+def get_hotel_list(
+    available_hotels: list, cache_dir: str = "./data/cache", ttl: int = 600
+) -> pd.DataFrame:
+    """Use the scraped list from the vendor website to query the table for Optimization details on the provided hotels.
+    The hotels are passed as an array parameter so the query text never changes and BigQuery can cache it, and results
+    are cached locally for a short time so retries and back to back runs don't rescan the table."""
 
     project_id = "project-id"
-    df = pd.read_gbq(stmt, dialect="standard", project_id=project_id)
+    optimization_table = "optimization-table"
+
+    hotels = sorted(set(available_hotels))
+    stmt = f"""SELECT hotel_cd, lst_optimization FROM `{optimization_table}` WHERE hotel_cd IN UNNEST(@hotels)"""
+
+    cache_key = hashlib.sha256(json.dumps([stmt, hotels]).encode("utf-8")).hexdigest()
+    cache_file = os.path.join(cache_dir, f"hotel_list_{cache_key}.pkl")
+
+    try:
+        if time.time() - os.path.getmtime(cache_file) < ttl:
+            df = pd.read_pickle(cache_file)
+            logger.info("Using cached optimization details", extra={"stage": "query"})
+            return df
+    except FileNotFoundError:
+        pass  # No cache yet, or another process pruned it
+
+    client = bigquery.Client(project=project_id)
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ArrayQueryParameter("hotels", "STRING", hotels)]
+    )
+    df = (
+        client.query(stmt, job_config=job_config)
+        .result()
+        .to_dataframe(create_bqstorage_client=True)
+    )
+
+    # Write to a temp file and swap it in so concurrent runs never read a half written cache
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_file = os.path.join(cache_dir, f"hotel_list_{cache_key}.{os.getpid()}.tmp.pkl")
+    df.to_pickle(temp_file)
+    os.replace(temp_file, cache_file)
+
+    prune_hotel_list_cache(cache_dir)
     return df
 
 
+def prune_hotel_list_cache(cache_dir: str, max_age: int = 24 * 60 * 60):
+    """Remove hotel list cache files well past any TTL so the cache doesn't grow with every hourly run. The age is
+    fixed rather than the caller's TTL so one run can't delete entries another process is still using."""
+
+    for filename in os.listdir(cache_dir):
+        if not (filename.startswith("hotel_list_") and filename.endswith(".pkl")):
+            continue
+        path = os.path.join(cache_dir, filename)
+        try:
+            if time.time() - os.path.getmtime(path) >= max_age:
+                os.remove(path)
+        except FileNotFoundError:
+            pass  # Already removed by another process
+
+
 if __name__ == "__main__":
     pass
@@ -0,0 +1,158 @@
+# Standard library
+from logging.handlers import QueueHandler
+import multiprocessing
+import copy
+import datetime
+import logging
+import json
+import os
+
+# Every module logs through the "src" package logger, the hot polling loops use its "poll" child
+package_logger = logging.getLogger("src")
+poll_logger = logging.getLogger("src.poll")
+
+_log_queue = None
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, tagged with the hotel and pipeline stage when they are given
+    through extra={"hotel": ..., "stage": ...}."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "hotel": getattr(record, "hotel", None),
+            "stage": getattr(record, "stage", None),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif getattr(record, "exception", None):
+            entry["exception"] = record.exception
+
+        return json.dumps(entry)
+
+
+class SamplingFilter(logging.Filter):
+    """Only let through one in every N records, used for loops that would otherwise log every poll."""
+
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.every = max(1, round(1 / sample_rate)) if sample_rate > 0 else None
+        self.count = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every is None:
+            return False
+
+        passed = self.count % self.every == 0
+        self.count += 1
+        return passed
+
+
+class StructuredQueueHandler(QueueHandler):
+    """QueueHandler that keeps the traceback in its own "exception" attribute. The default prepare() merges it into
+    the message and drops exc_info, which would leave the JSON "exception" field empty."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.exception = (
+            logging.Formatter().formatException(record.exc_info)
+            if record.exc_info
+            else None
+        )
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+
+        return record
+
+
+def _listener_main(log_queue, log_path: str):
+    """Runs in the listener process, the only place that writes to the log file."""
+
+    handler = logging.FileHandler(log_path)
+    handler.setFormatter(JsonFormatter())
+
+    while True:
+        record = log_queue.get()
+        if record is None:
+            break
+        handler.handle(record)
+
+    handler.close()
+
+
+def configure_worker_logging(
+    log_queue,
+    level: str = None,
+    poll_level: str = None,
+    poll_sample_rate: float = None,
+):
+    """Send this process's records to the listener through the queue. Used as the initializer for process pool
+    workers so they never write to the log file themselves."""
+
+    level = level or os.getenv("LOG_LEVEL", "DEBUG")
+    poll_level = poll_level or os.getenv("POLL_LOG_LEVEL", "INFO")
+    if poll_sample_rate is None:
+        poll_sample_rate = float(os.getenv("POLL_LOG_SAMPLE_RATE", "0.1"))
+
+    package_logger.handlers.clear()
+    package_logger.addHandler(StructuredQueueHandler(log_queue))
+    package_logger.setLevel(level)
+    package_logger.propagate = False
+
+    poll_logger.filters.clear()
+    poll_logger.addFilter(SamplingFilter(poll_sample_rate))
+    poll_logger.setLevel(poll_level)
+
+
+def start_logging(log_path: str = "./logs/debug.log", **kwargs):
+    """Start the listener process and route this process's logging through it. Levels and sampling for the polling
+    loops can be passed in or set with LOG_LEVEL, POLL_LOG_LEVEL and POLL_LOG_SAMPLE_RATE."""
+
+    global _log_queue, _listener
+
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+
+    _log_queue = multiprocessing.Queue(-1)
+    _listener = multiprocessing.Process(
+        target=_listener_main,
+        args=(_log_queue, log_path),
+        name="log-listener",
+        daemon=True,
+    )
+    _listener.start()
+
+    configure_worker_logging(_log_queue, **kwargs)
+
+
+def stop_logging():
+    """Flush the remaining records and shut down the listener process."""
+
+    global _log_queue, _listener
+
+    if _listener is None:
+        return
+
+    _log_queue.put(None)
+    _listener.join()
+    package_logger.handlers.clear()
+    _log_queue = None
+    _listener = None
+
+
+def get_log_queue():
+    """Return the queue used by the listener, or None when logging hasn't been started."""
+
+    return _log_queue
+
+
+if __name__ == "__main__":
+    pass
@@ -13,18 +13,15 @@ import time
 import logging
 import concurrent.futures
 
-
+# Internal
+from .log_setup import (
+    configure_worker_logging,
+    get_log_queue,
+    poll_logger,
+)
+
+# Handlers are attached by log_setup.start_logging, importing this module has no logging side effects
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-
-debug_handler = logging.FileHandler("./logs/debug.log")
-
-debug_handler.setLevel(logging.DEBUG)
-
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-debug_handler.setFormatter(formatter)
-
-logger.addHandler(debug_handler)
 
 
 def process_function_helper(item, func, extra_param):
@@ -32,19 +29,35 @@ def process_function_helper(item, func, extra_param):
     return func(item, extra_param)
 
 
-def initiate_multiprocess(func, iterable, workers=3, extra_param=None):
+def initiate_multiprocess(
+    func, iterable, workers=3, extra_param=None, return_exceptions=False
+):
     """For performance gains processpool is utilized in a few areas of the application like
     webscraping, modifying files, and copying files to Google Cloud Storage. Partial is used to allow for another
-    parameter for copying files to GCS."""
+    parameter for copying files to GCS. With return_exceptions a failed item returns its exception in place of a
+    result instead of discarding the results of the others."""
 
-    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
-        if extra_param is None:
+    # Workers hand their records to the log listener instead of writing to the log file themselves
+    log_queue = get_log_queue()
+    initializer = configure_worker_logging if log_queue is not None else None
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=(log_queue,)
+    ) as executor:
+        if extra_param is not None:
+            func = partial(process_function_helper, func=func, extra_param=extra_param)
+
+        if not return_exceptions:
             return list(executor.map(func, iterable))
-        else:
-            partial_func = partial(
-                process_function_helper, func=func, extra_param=extra_param
-            )
-            return list(executor.map(partial_func, iterable))
+
+        futures = [executor.submit(func, item) for item in iterable]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
 
 
 def clean_up_downloads():
@@ -108,7 +121,10 @@ def validate_file_download(hotel: str) -> bool:
                 dl_wait = False
                 return True
             elif hotel in filename and filename.endswith(".crdownload"):
-                logger.info(f"File: {filename} has not completed download.")
+                poll_logger.info(
+                    f"File: {filename} has not completed download.",
+                    extra={"hotel": hotel, "stage": "download"},
+                )
         time.sleep(1)
         seconds += 1
     return False
@@ -4,6 +4,11 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import (
+    InvalidSessionIdException,
+    NoSuchWindowException,
+    WebDriverException,
+)
 
 # Standard library
 from retry import retry
@@ -20,6 +25,14 @@ from .webdriver_setup import (
     get_env_details,
     create_webdriver,
 )
+from .dom_extract import (
+    wait_for_stable_count,
+    extract_list,
+)
+from .work_queue import (
+    get_work_queue,
+    get_worker_id,
+)
 
 
 def login_to_site(driver: webdriver, USERNAME: str, PASSWORD: str):
@@ -64,13 +77,19 @@ def get_available_n2p_hotels(driver: webdriver) -> list:
 
     combobox_button.click()
 
-    hotel_dropdown = WebDriverWait(driver, 15).until(
+    WebDriverWait(driver, 15).until(
         EC.visibility_of_element_located((By.CLASS_NAME, "k-list-ul"))
     )
-    time.sleep(1)  # Allow for loading
-    hotels = hotel_dropdown.find_elements(By.CLASS_NAME, "k-list-item-text")
+    # Scope to the open kendo popup so no other list on the page is picked up
+    hotel_list_container = "kendo-popup .k-list-content, kendo-popup .k-list-scroller"
+    wait_for_stable_count(
+        driver, ".k-list-ul .k-list-item-text", container_selector=hotel_list_container
+    )
 
-    hotel_list = [hotel.text for hotel in hotels]
+    # Read the whole kendo list in the browser, scrolling through it only if it is virtualized
+    hotel_list = extract_list(
+        driver, hotel_list_container, ".k-list-ul .k-list-item-text"
+    )
 
     return hotel_list
 
@@ -107,10 +126,127 @@ def download_main(hotels):
         try:
             download_differentials(driver, hotel)
         except CustomException:
-            logger.error(f"Unable to download or validate file for {hotel}")
+            logger.error(
+                f"Unable to download or validate file for {hotel}",
+                extra={"hotel": hotel, "stage": "download"},
+            )
     driver.close()
 
 
+def multiprocess_queue_downloads(queue_url: str, num_workers: int = 3) -> list:
+    """Setup for multiprocess of the downloads when running as a worker host in distributed mode. Each worker takes
+    leases on hotels from the shared queue instead of working through a fixed batch. Returns (hotel, worker_id) pairs
+    for the downloaded hotels, whose leases are still held until their files are loaded. A worker that crashes
+    outright doesn't discard what the other workers downloaded."""
+
+    results = initiate_multiprocess(
+        func=queue_download_main,
+        iterable=[queue_url] * num_workers,
+        workers=num_workers,
+        return_exceptions=True,
+    )
+
+    downloaded = []
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Download worker failed: {result!r}", extra={"stage": "download"})
+        else:
+            downloaded.extend(result)
+
+    return downloaded
+
+
+def browser_is_alive(driver: webdriver) -> bool:
+    """Check whether the browser session is still usable, so a dead browser isn't mistaken for a failed download."""
+
+    try:
+        driver.current_url
+    except (InvalidSessionIdException, NoSuchWindowException):
+        return False
+
+    return True
+
+
+def queue_download_main(
+    queue_url: str,
+    lease_seconds: int = 300,
+    hold_seconds: int = 2 * 60 * 60,
+    poll_interval: int = 10,
+    max_idle_seconds: int = None,
+) -> list:
+    """Distributed version of download_main. Hotels are leased one at a time from the shared work queue. While other
+    hotels are still outstanding the worker keeps polling for up to max_idle_seconds (by default long enough for a
+    dead worker's lease to expire), so released or expired hotels get picked up again.
+
+    A downloaded hotel keeps its lease (extended to hold_seconds) so the coordinator only sees it as done once the host
+    has loaded its files. If the browser dies the lease is released and the worker stops, rather than failing every
+    remaining hotel in the queue. Returns (hotel, worker_id) pairs for what this worker downloaded, even if it fails."""
+
+    if max_idle_seconds is None:
+        max_idle_seconds = lease_seconds + poll_interval
+
+    queue = get_work_queue(queue_url)
+    worker_id = get_worker_id()
+    downloaded = []
+    driver = None
+
+    try:
+        USERNAME, PASSWORD = get_env_details()
+        driver = create_webdriver()
+        driver.get("mainwebsite.com")
+
+        login_to_site(driver, USERNAME, PASSWORD)
+        idle_since = None
+        while True:
+            hotel = queue.lease(worker_id, lease_seconds=lease_seconds)
+            if hotel is None:
+                if queue.remaining() == 0:
+                    break
+                idle_since = idle_since or time.monotonic()
+                if time.monotonic() - idle_since >= max_idle_seconds:
+                    break
+                time.sleep(poll_interval)
+                continue
+            idle_since = None
+
+            try:
+                select_hotel_for_download(driver, hotel)
+                download_differentials(driver, hotel)
+            except CustomException as e:
+                if not browser_is_alive(driver):
+                    logger.error(
+                        f"Browser died on {hotel}, releasing it and stopping this worker",
+                        extra={"hotel": hotel, "stage": "download"},
+                    )
+                    queue.release(hotel, worker_id)
+                    break
+                logger.error(
+                    f"Unable to download or validate file for {hotel}",
+                    extra={"hotel": hotel, "stage": "download"},
+                )
+                queue.report(hotel, worker_id, success=False, error=repr(e))
+            except Exception:
+                logger.exception(
+                    f"Browser failed on {hotel}, releasing it and stopping this worker",
+                    extra={"hotel": hotel, "stage": "download"},
+                )
+                queue.release(hotel, worker_id)
+                break
+            else:
+                queue.renew(hotel, worker_id, lease_seconds=hold_seconds)
+                downloaded.append((hotel, worker_id))
+    except Exception:
+        logger.exception("Download worker stopped early", extra={"stage": "download"})
+    finally:
+        if driver is not None:
+            try:
+                driver.close()
+            except WebDriverException:
+                pass
+
+    return downloaded
+
+
 def get_hotels_for_query() -> list:
     """Logins into the vendor site to scrape the available hotels for further processing."""
 
@@ -122,7 +258,7 @@ def get_hotels_for_query() -> list:
 
     available_hotels = get_available_n2p_hotels(driver)
 
-    return ", ".join(['"' + hotel + '"' for hotel in available_hotels])
+    return available_hotels
 
 
 def select_hotel_for_download(driver, hotel: str):
@@ -163,13 +299,19 @@ def download_differentials(driver: webdriver, hotel: str):
         button.click()
 
     except Exception:
-        logger.warning("Timeout of Vendor website occurred")
+        logger.warning(
+            "Timeout of Vendor website occurred",
+            extra={"hotel": hotel, "stage": "download"},
+        )
         raise CustomException  # Kick off retry
 
     try:
         validate_file = validate_file_download(hotel)
         if not validate_file:
-            logger.warning(f"Download failed for {hotel}, trying again")
+            logger.warning(
+                f"Download failed for {hotel}, trying again",
+                extra={"hotel": hotel, "stage": "download"},
+            )
             select_hotel_for_download(
                 driver, hotel
             )  # Ensure the right hotel is selected before retry
@@ -0,0 +1,359 @@
+# Standard library
+from contextlib import contextmanager
+from urllib.parse import urlparse
+import sqlite3
+import socket
+import time
+import os
+
+# Internal
+from .log_setup import (
+    poll_logger,
+)
+from .utils import (
+    logger,
+)
+
+# Queue states for a published hotel
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def get_worker_id() -> str:
+    """Identify this worker across hosts so leases can be traced back to the machine that took them."""
+
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class SQLiteWorkQueue:
+    """Work queue stored in a SQLite file. Every write is wrapped in BEGIN IMMEDIATE so only one process can lease
+    a given hotel. SQLite locking is not reliable over network filesystems (NFS/SMB), so keep the file on local disk
+    and use RedisWorkQueue when workers run on more than one host."""
+
+    def __init__(self, path: str, timeout: int = 30):
+        self.path = path
+        self.timeout = timeout
+
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS hotel_queue (
+                    hotel_cd TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    worker_id TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT
+                )"""
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def publish(self, hotels: list):
+        """Replace the contents of the queue with the given hotels, clearing out anything left over from a previous run."""
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM hotel_queue")
+            conn.executemany(
+                "INSERT OR IGNORE INTO hotel_queue (hotel_cd, status) VALUES (?, ?)",
+                [(hotel, PENDING) for hotel in hotels],
+            )
+            conn.execute("COMMIT")
+
+    def lease(self, worker_id: str, lease_seconds: int = 300, max_attempts: int = 3):
+        """Take the next pending hotel, or a hotel whose lease has expired because its worker died."""
+
+        now = time.time()
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """SELECT hotel_cd FROM hotel_queue
+                WHERE (status = ? OR (status = ? AND lease_expires < ?)) AND attempts < ?
+                ORDER BY attempts, hotel_cd LIMIT 1""",
+                (PENDING, LEASED, now, max_attempts),
+            ).fetchone()
+
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                """UPDATE hotel_queue SET status = ?, worker_id = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE hotel_cd = ?""",
+                (LEASED, worker_id, now + lease_seconds, row[0]),
+            )
+            conn.execute("COMMIT")
+
+        return row[0]
+
+    def renew(self, hotel: str, worker_id: str, lease_seconds: int):
+        """Extend a lease this worker still holds, e.g. to keep a downloaded hotel while its files are loaded."""
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                """UPDATE hotel_queue SET lease_expires = ?
+                WHERE hotel_cd = ? AND worker_id = ? AND status = ?""",
+                (time.time() + lease_seconds, hotel, worker_id, LEASED),
+            )
+            conn.execute("COMMIT")
+
+    def release(self, hotel: str, worker_id: str, max_attempts: int = 3):
+        """Give a lease back so another worker can pick the hotel up straight away, used when this worker can't go on."""
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                """UPDATE hotel_queue SET status = CASE WHEN attempts < ? THEN ? ELSE ? END,
+                worker_id = NULL, lease_expires = NULL
+                WHERE hotel_cd = ? AND worker_id = ? AND status = ?""",
+                (max_attempts, PENDING, FAILED, hotel, worker_id, LEASED),
+            )
+            conn.execute("COMMIT")
+
+    def report(self, hotel: str, worker_id: str, success: bool, error: str = None):
+        """Record the outcome for a leased hotel. Reports from a worker that no longer holds the lease are ignored."""
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                """UPDATE hotel_queue SET status = ?, lease_expires = NULL, error = ?
+                WHERE hotel_cd = ? AND worker_id = ? AND status = ?""",
+                (DONE if success else FAILED, error, hotel, worker_id, LEASED),
+            )
+            conn.execute("COMMIT")
+
+    def remaining(self, max_attempts: int = 3) -> int:
+        """Number of hotels that are still pending or leased and could still be worked on."""
+
+        with self._connect() as conn:
+            (count,) = conn.execute(
+                """SELECT COUNT(*) FROM hotel_queue
+                WHERE status = ? OR (status = ? AND (lease_expires >= ? OR attempts < ?))""",
+                (PENDING, LEASED, time.time(), max_attempts),
+            ).fetchone()
+
+        return count
+
+    def results(self) -> dict:
+        """Return the status of every hotel in the queue."""
+
+        with self._connect() as conn:
+            rows = conn.execute("SELECT hotel_cd, status FROM hotel_queue").fetchall()
+
+        return dict(rows)
+
+
+# Lua scripts so every Redis state change runs atomically on the server. The status strings match the constants above.
+# KEYS: pending, leases, status, worker, attempts, error
+REQUEUE_EXPIRED_LUA = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, hotel in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], hotel)
+    redis.call('HDEL', KEYS[4], hotel)
+    if tonumber(redis.call('HGET', KEYS[5], hotel) or '0') < tonumber(ARGV[2]) then
+        redis.call('HSET', KEYS[3], hotel, 'pending')
+        redis.call('RPUSH', KEYS[1], hotel)
+    else
+        redis.call('HSET', KEYS[3], hotel, 'failed')
+    end
+end
+"""
+
+# ARGV: now, max_attempts, lease expiry, worker_id
+LEASE_LUA = (
+    REQUEUE_EXPIRED_LUA
+    + """
+local hotel = redis.call('LPOP', KEYS[1])
+if not hotel then return false end
+redis.call('ZADD', KEYS[2], ARGV[3], hotel)
+redis.call('HSET', KEYS[3], hotel, 'leased')
+redis.call('HSET', KEYS[4], hotel, ARGV[4])
+redis.call('HINCRBY', KEYS[5], hotel, 1)
+return hotel
+"""
+)
+
+# ARGV: now, max_attempts
+REMAINING_LUA = (
+    REQUEUE_EXPIRED_LUA
+    + """
+return redis.call('LLEN', KEYS[1]) + redis.call('ZCARD', KEYS[2])
+"""
+)
+
+# ARGV: hotel, worker_id, ...
+OWNS_LEASE_LUA = """
+local function owns_lease()
+    return redis.call('HGET', KEYS[4], ARGV[1]) == ARGV[2] and redis.call('ZSCORE', KEYS[2], ARGV[1])
+end
+"""
+
+# ARGV: hotel, worker_id, lease expiry
+RENEW_LUA = (
+    OWNS_LEASE_LUA
+    + """
+if not owns_lease() then return 0 end
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+return 1
+"""
+)
+
+# ARGV: hotel, worker_id, max_attempts
+RELEASE_LUA = (
+    OWNS_LEASE_LUA
+    + """
+if not owns_lease() then return 0 end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[4], ARGV[1])
+if tonumber(redis.call('HGET', KEYS[5], ARGV[1]) or '0') < tonumber(ARGV[3]) then
+    redis.call('HSET', KEYS[3], ARGV[1], 'pending')
+    redis.call('LPUSH', KEYS[1], ARGV[1])
+else
+    redis.call('HSET', KEYS[3], ARGV[1], 'failed')
+end
+return 1
+"""
+)
+
+# ARGV: hotel, worker_id, status, error
+REPORT_LUA = (
+    OWNS_LEASE_LUA
+    + """
+if not owns_lease() then return 0 end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[3])
+if ARGV[4] ~= '' then redis.call('HSET', KEYS[6], ARGV[1], ARGV[4]) end
+return 1
+"""
+)
+
+
+class RedisWorkQueue:
+    """Work queue stored in Redis (or any Redis-compatible server), the backend to use when workers run on more than
+    one host. Pending hotels sit in a list, leases in a sorted set scored by expiry time and statuses in a hash. Each
+    transition runs as a Lua script so a worker dying part way through can't lose a hotel."""
+
+    def __init__(self, url: str, prefix: str = "hotel_queue"):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.pending_key = f"{prefix}:pending"
+        self.leases_key = f"{prefix}:leases"
+        self.status_key = f"{prefix}:status"
+        self.worker_key = f"{prefix}:worker"
+        self.attempts_key = f"{prefix}:attempts"
+        self.error_key = f"{prefix}:error"
+        self.keys = [
+            self.pending_key,
+            self.leases_key,
+            self.status_key,
+            self.worker_key,
+            self.attempts_key,
+            self.error_key,
+        ]
+
+        self._lease = self.client.register_script(LEASE_LUA)
+        self._remaining = self.client.register_script(REMAINING_LUA)
+        self._renew = self.client.register_script(RENEW_LUA)
+        self._release = self.client.register_script(RELEASE_LUA)
+        self._report = self.client.register_script(REPORT_LUA)
+
+    def publish(self, hotels: list):
+        """Replace the contents of the queue with the given hotels, clearing out anything left over from a previous run."""
+
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(*self.keys)
+        if hotels:
+            pipe.rpush(self.pending_key, *hotels)
+            pipe.hset(self.status_key, mapping={hotel: PENDING for hotel in hotels})
+        pipe.execute()
+
+    def lease(self, worker_id: str, lease_seconds: int = 300, max_attempts: int = 3):
+        """Take the next pending hotel, or a hotel whose lease has expired because its worker died."""
+
+        now = time.time()
+
+        return self._lease(
+            keys=self.keys, args=[now, max_attempts, now + lease_seconds, worker_id]
+        )
+
+    def renew(self, hotel: str, worker_id: str, lease_seconds: int):
+        """Extend a lease this worker still holds, e.g. to keep a downloaded hotel while its files are loaded."""
+
+        self._renew(keys=self.keys, args=[hotel, worker_id, time.time() + lease_seconds])
+
+    def release(self, hotel: str, worker_id: str, max_attempts: int = 3):
+        """Give a lease back so another worker can pick the hotel up straight away, used when this worker can't go on."""
+
+        self._release(keys=self.keys, args=[hotel, worker_id, max_attempts])
+
+    def report(self, hotel: str, worker_id: str, success: bool, error: str = None):
+        """Record the outcome for a leased hotel. Reports from a worker that no longer holds the lease are ignored."""
+
+        self._report(
+            keys=self.keys,
+            args=[hotel, worker_id, DONE if success else FAILED, error or ""],
+        )
+
+    def remaining(self, max_attempts: int = 3) -> int:
+        """Number of hotels that are still pending or leased and could still be worked on."""
+
+        return self._remaining(keys=self.keys, args=[time.time(), max_attempts])
+
+    def results(self) -> dict:
+        """Return the status of every hotel in the queue."""
+
+        return self.client.hgetall(self.status_key)
+
+
+def get_work_queue(url: str):
+    """Create the queue backend from a url, either sqlite:///path/to/queue.db or redis://host:port/db."""
+
+    parsed = urlparse(url)
+
+    if parsed.scheme == "sqlite":
+        return SQLiteWorkQueue(url[len("sqlite:///") :])
+    elif parsed.scheme in ("redis", "rediss", "unix"):
+        return RedisWorkQueue(url)
+    else:
+        raise ValueError(f"Unsupported work queue url: {url}")
+
+
+def wait_for_queue(
+    queue, poll_interval: int = 10, max_attempts: int = 3, timeout: int = 3 * 60 * 60
+) -> dict:
+    """Block the coordinator until every published hotel has been reported or has run out of attempts. Gives up after
+    the timeout so a fleet that stopped early can't hang the run; anything unfinished is picked up next time."""
+
+    deadline = time.monotonic() + timeout
+
+    while True:
+        remaining = queue.remaining(max_attempts)
+        if remaining == 0:
+            break
+        if time.monotonic() >= deadline:
+            logger.warning(
+                f"Stopped waiting with {remaining} hotel(s) unfinished",
+                extra={"stage": "coordinate"},
+            )
+            break
+        poll_logger.info(
+            f"Waiting on {remaining} hotel(s) from workers", extra={"stage": "coordinate"}
+        )
+        time.sleep(poll_interval)
+
+    return queue.results()
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,101 @@
+import pytest
+
+from src.work_queue import (
+    DONE,
+    FAILED,
+    LEASED,
+    PENDING,
+    get_work_queue,
+)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = get_work_queue(f"sqlite:///{tmp_path / 'queue.db'}")
+    queue.publish(["AAAAA", "BBBBB"])
+    return queue
+
+
+def test_publish_clears_previous_run(queue):
+    queue.lease("w1")
+    queue.publish(["CCCCC"])
+
+    assert queue.results() == {"CCCCC": PENDING}
+
+
+def test_lease_is_exclusive(queue):
+    first = queue.lease("w1")
+    second = queue.lease("w2")
+
+    assert {first, second} == {"AAAAA", "BBBBB"}
+    assert queue.lease("w3") is None
+
+
+def test_expired_lease_is_leased_again(queue):
+    queue.publish(["AAAAA"])
+    queue.lease("w1", lease_seconds=-1)
+
+    assert queue.lease("w2") == "AAAAA"
+    assert queue.results() == {"AAAAA": LEASED}
+
+
+def test_max_attempts_cut_off(queue):
+    queue.publish(["AAAAA"])
+    queue.lease("w1", lease_seconds=-1, max_attempts=2)
+    queue.lease("w2", lease_seconds=-1, max_attempts=2)
+
+    assert queue.lease("w3", max_attempts=2) is None
+    assert queue.remaining(max_attempts=2) == 0
+
+
+def test_report_from_previous_lease_holder_is_ignored(queue):
+    queue.publish(["AAAAA"])
+    queue.lease("w1", lease_seconds=-1)
+    queue.lease("w2")
+
+    queue.report("AAAAA", "w1", success=False, error="stale")
+    assert queue.results() == {"AAAAA": LEASED}
+
+    queue.report("AAAAA", "w2", success=True)
+    assert queue.results() == {"AAAAA": DONE}
+
+
+def test_release_returns_hotel_to_pending(queue):
+    queue.publish(["AAAAA"])
+    queue.lease("w1")
+    queue.release("AAAAA", "w1")
+
+    assert queue.results() == {"AAAAA": PENDING}
+    assert queue.lease("w2") == "AAAAA"
+
+
+def test_release_after_last_attempt_fails_hotel(queue):
+    queue.publish(["AAAAA"])
+    queue.lease("w1", max_attempts=1)
+    queue.release("AAAAA", "w1", max_attempts=1)
+
+    assert queue.results() == {"AAAAA": FAILED}
+    assert queue.remaining(max_attempts=1) == 0
+
+
+def test_remaining_counts(queue):
+    assert queue.remaining() == 2
+
+    queue.lease("w1")
+    assert queue.remaining() == 2  # Leased hotels are still outstanding
+
+    queue.report("AAAAA", "w1", success=True)
+    assert queue.remaining() == 1
+
+    queue.lease("w2")
+    queue.report("BBBBB", "w2", success=False)
+    assert queue.remaining() == 0
+
+
+def test_renewed_lease_is_not_leased_again(queue):
+    queue.publish(["AAAAA"])
+    queue.lease("w1", lease_seconds=-1)
+    queue.renew("AAAAA", "w1", lease_seconds=300)
+
+    assert queue.lease("w2") is None
+    assert queue.remaining() == 1